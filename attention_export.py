@@ -0,0 +1,136 @@
+import os
+
+import numpy as np
+
+from visualize_interactive import compute_entropy, extract_attention, get_memory_budget, tokenize_batch
+
+
+# Prompts tokenized per batch, so only a batch of encodings is held at a time
+TOKENIZE_BATCH_SIZE = 64
+
+
+def iter_attention(session, texts, prompt_ids=None, memory_budget_mb=None):
+    tokenizer, model, _ = session
+    if prompt_ids is None:
+        prompt_ids = range(len(texts))
+    prompt_ids = list(prompt_ids)
+    if len(prompt_ids) != len(texts):
+        raise ValueError(f"Got {len(prompt_ids)} prompt_ids for {len(texts)} texts")
+    memory_budget = get_memory_budget(memory_budget_mb)
+
+    for start in range(0, len(texts), TOKENIZE_BATCH_SIZE):
+        batch = tokenize_batch(tokenizer, texts[start:start + TOKENIZE_BATCH_SIZE])
+        for prompt_id, (input_ids, display_tokens) in zip(prompt_ids[start:], batch):
+            # Nothing is embedded in a page, so the whole budget is available for extraction
+            attention, layers = extract_attention(model, input_ids, memory_budget, dense=False)
+            yield prompt_id, display_tokens, attention, layers
+
+
+def _layer_tables(pa, prompt_id, layer, attention, threshold):
+    num_heads, seq_len = attention.shape[:2]
+
+    # Causal positions only; with a threshold, weaker links are dropped
+    mask = np.broadcast_to(np.tri(seq_len, dtype=bool), attention.shape)
+    if threshold > 0:
+        mask = mask & (attention >= threshold)
+    head, q, k = np.nonzero(mask)
+    values = pa.table({
+        "prompt_id": pa.array(np.full(len(head), prompt_id)),
+        "layer": pa.array(np.full(len(head), layer, dtype=np.int16)),
+        "head": pa.array(head.astype(np.int16)),
+        "q": pa.array(q.astype(np.int32)),
+        "k": pa.array(k.astype(np.int32)),
+        "value": pa.array(attention[head, q, k].astype(np.float32)),
+    })
+
+    entropy = compute_entropy(attention)
+    head, q = np.indices(entropy.shape).reshape(2, -1)
+    entropies = pa.table({
+        "prompt_id": pa.array(np.full(len(head), prompt_id)),
+        "layer": pa.array(np.full(len(head), layer, dtype=np.int16)),
+        "head": pa.array(head.astype(np.int16)),
+        "q": pa.array(q.astype(np.int32)),
+        "entropy": pa.array(entropy.reshape(-1).astype(np.float32)),
+    })
+    return values, entropies
+
+
+def export_columnar(session, texts, output_dir, format="parquet", prompt_ids=None, threshold=0.0,
+                    memory_budget_mb=None, row_group_size=1024 * 1024):
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Columnar export requires pyarrow: pip install pyarrow") from e
+    if format not in ("parquet", "arrow"):
+        raise ValueError(f"Unknown format {format!r}, expected 'parquet' or 'arrow'")
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {name: os.path.join(output_dir, f"{name}.{format}") for name in ("attention", "entropy")}
+    writers = {}
+    buffers = {name: [] for name in paths}
+
+    def flush(name, final=False):
+        table = pa.concat_tables(buffers[name]).combine_chunks()
+        # Only whole row groups are written until the end, the remainder stays buffered
+        rows = table.num_rows if final else table.num_rows // row_group_size * row_group_size
+        buffers[name] = [table.slice(rows)] if rows < table.num_rows else []
+        if name not in writers:
+            if format == "parquet":
+                writers[name] = pa.parquet.ParquetWriter(paths[name], table.schema)
+            else:
+                writers[name] = pa.ipc.new_file(paths[name], table.schema)
+        if format == "parquet":
+            writers[name].write_table(table.slice(0, rows), row_group_size=row_group_size)
+        else:
+            writers[name].write_table(table.slice(0, rows), max_chunksize=row_group_size)
+
+    def write(name, table):
+        buffers[name].append(table)
+        if sum(buffered.num_rows for buffered in buffers[name]) >= row_group_size:
+            flush(name)
+
+    try:
+        for prompt_id, _, attention, layers in iter_attention(session, texts, prompt_ids, memory_budget_mb):
+            # Layers are converted one at a time and buffered into row groups / record batches
+            # of row_group_size rows
+            for i, layer in enumerate(layers):
+                values, entropies = _layer_tables(pa, prompt_id, layer, np.asarray(attention[i]), threshold)
+                write("attention", values)
+                write("entropy", entropies)
+            print(f"Exported prompt {prompt_id}")
+        for name, buffered in buffers.items():
+            if buffered:
+                flush(name, final=True)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    return paths
+
+
+def export_zarr(session, texts, output_dir, prompt_ids=None, memory_budget_mb=None):
+    try:
+        import zarr
+    except ImportError as e:
+        raise ImportError("Zarr export requires zarr: pip install zarr") from e
+
+    for prompt_id, display_tokens, attention, layers in iter_attention(session, texts, prompt_ids, memory_budget_mb):
+        num_layers, num_heads, seq_len = attention.shape[:3]
+        prefix = os.path.join(output_dir, str(prompt_id))
+
+        # Chunked per layer, matching the order layers are written in
+        values = zarr.open_array(os.path.join(prefix, "attention"), mode="w", dtype="float32",
+                                 shape=attention.shape, chunks=(1, num_heads, seq_len, seq_len))
+        entropies = zarr.open_array(os.path.join(prefix, "entropy"), mode="w", dtype="float32",
+                                    shape=(num_layers, num_heads, seq_len), chunks=(1, num_heads, seq_len))
+        for i in range(num_layers):
+            layer_attention = np.asarray(attention[i])
+            values[i] = layer_attention
+            entropies[i] = compute_entropy(layer_attention)
+
+        values.attrs.update({"tokens": display_tokens, "layers": layers})
+        print(f"Exported prompt {prompt_id}")
+
+    return output_dir
@@ -0,0 +1,125 @@
+import asyncio
+import os
+import uuid
+
+from visualize_interactive import get_memory_budget, load_model, write_report
+
+
+class AttentionJob:
+    def __init__(self, key, text, output_file):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.text = text
+        self.output_file = output_file
+        self.future = asyncio.get_running_loop().create_future()
+
+    def done(self):
+        return self.future.done()
+
+    def cancel(self):
+        return self.future.cancel()
+
+    def __await__(self):
+        # Shielded so one awaiter giving up does not cancel the job for deduplicated submitters
+        return asyncio.shield(self.future).__await__()
+
+
+class AttentionJobQueue:
+    def __init__(self, model_name="Qwen/Qwen2.5-0.5B", pool_size=2, max_pending=32,
+                 output_dir="reports", memory_budget_mb=None, offline=False):
+        self.model_name = model_name
+        self.pool_size = pool_size
+        self.max_pending = max_pending
+        self.output_dir = output_dir
+        self.memory_budget_mb = memory_budget_mb
+        self.offline = offline
+        self._queue = None
+        self._worker_budget_mb = None
+        self._in_flight = {}
+        self._workers = []
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close(cancel_pending=exc_type is not None)
+
+    @property
+    def pending(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        # Workers run concurrently, so each gets an equal share of the budget
+        memory_budget = get_memory_budget(self.memory_budget_mb)
+        if memory_budget is not None:
+            self._worker_budget_mb = memory_budget / self.pool_size / 2**20
+        # One resident model per worker, so jobs never share a model across threads
+        sessions = await asyncio.gather(
+            *(asyncio.to_thread(load_model, self.model_name) for _ in range(self.pool_size))
+        )
+        self._workers = [asyncio.create_task(self._worker(session)) for session in sessions]
+
+    async def submit(self, text, wait=True):
+        if self._queue is None:
+            raise RuntimeError("AttentionJobQueue.start() has not been called")
+
+        key = (self.model_name, text)
+        job = self._in_flight.get(key)
+        if job is not None and not job.done():
+            return job
+
+        job = AttentionJob(key, text, os.path.join(self.output_dir, f"attention_{uuid.uuid4().hex[:12]}.html"))
+        self._in_flight[key] = job
+        job.future.add_done_callback(lambda _: self._forget(job))
+        try:
+            if wait:
+                await self._queue.put(job)
+            else:
+                self._queue.put_nowait(job)
+        except BaseException:
+            job.cancel()
+            raise
+        return job
+
+    async def close(self, cancel_pending=False):
+        if self._queue is None:
+            return
+        if cancel_pending:
+            for job in list(self._in_flight.values()):
+                job.cancel()
+        await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    def _forget(self, job):
+        if self._in_flight.get(job.key) is job:
+            del self._in_flight[job.key]
+
+    async def _worker(self, session):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.done():
+                    continue
+                try:
+                    path = await asyncio.to_thread(
+                        write_report, session, job.text, job.output_file,
+                        self._worker_budget_mb, self.offline
+                    )
+                except Exception as e:
+                    if not job.done():
+                        job.future.set_exception(e)
+                    continue
+                if job.done():
+                    # Cancelled while the model was running; the report is no longer wanted
+                    os.remove(path)
+                else:
+                    job.future.set_result(path)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, processors, trainers
+from transformers import PreTrainedTokenizerFast
+
+from helpers import MODELS, make_session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CORPUS = [
+    "The quick brown fox jumps over the lazy dog.",
+    "Attention heads relate every token to the tokens before it.",
+    "Hello world, this is a tiny tokenizer for tests.",
+]
+
+
+@pytest.fixture(scope="session")
+def tokenizer():
+    # Byte-level BPE like GPT-2 and Qwen2, trained locally so no download is needed
+    bpe = Tokenizer(models.BPE())
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    bpe.post_processor = processors.ByteLevel(trim_offsets=True)
+    bpe.train_from_iterator(CORPUS, trainers.BpeTrainer(
+        vocab_size=400, initial_alphabet=pre_tokenizers.ByteLevel.alphabet(), special_tokens=["<|endoftext|>"]
+    ))
+    return PreTrainedTokenizerFast(tokenizer_object=bpe, eos_token="<|endoftext|>", bos_token="<|endoftext|>")
+
+
+@pytest.fixture(scope="session")
+def metaspace_tokenizer():
+    # SentencePiece-style BPE (Llama, T5, Mistral): words start with a prepended '▁' marker
+    bpe = Tokenizer(models.BPE(unk_token="<unk>"))
+    bpe.pre_tokenizer = pre_tokenizers.Metaspace()
+    bpe.decoder = decoders.Metaspace()
+    bpe.train_from_iterator(CORPUS, trainers.BpeTrainer(vocab_size=300, special_tokens=["<unk>", "<s>"]))
+    return PreTrainedTokenizerFast(tokenizer_object=bpe, unk_token="<unk>", bos_token="<s>", eos_token="<s>")
+
+
+@pytest.fixture(params=sorted(MODELS))
+def session(request, tokenizer):
+    return make_session(tokenizer, request.param)
@@ -0,0 +1,29 @@
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel, Qwen2Config, Qwen2ForCausalLM
+
+TEXT = "The quick brown fox jumps over the lazy dog."
+PERTURBED_TEXT = "The quick red fox jumps over the sleepy dog."
+
+
+def _gpt2(vocab_size, eos_id, num_layers):
+    return GPT2LMHeadModel(GPT2Config(
+        n_layer=num_layers, n_head=4, n_embd=32, n_positions=128, vocab_size=vocab_size,
+        bos_token_id=eos_id, eos_token_id=eos_id, attn_implementation="eager",
+    ))
+
+
+def _qwen2(vocab_size, eos_id, num_layers):
+    return Qwen2ForCausalLM(Qwen2Config(
+        num_hidden_layers=num_layers, num_attention_heads=4, num_key_value_heads=2, hidden_size=32,
+        intermediate_size=64, max_position_embeddings=128, vocab_size=vocab_size,
+        bos_token_id=eos_id, eos_token_id=eos_id, attn_implementation="eager",
+    ))
+
+
+MODELS = {"tiny-gpt2": _gpt2, "tiny-qwen2": _qwen2}
+
+
+def make_session(tokenizer, name, seed=0, num_layers=3):
+    torch.manual_seed(seed)
+    model = MODELS[name](len(tokenizer), tokenizer.eos_token_id, num_layers)
+    return tokenizer, model.eval(), name
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import attention_jobs
+import visualize_interactive as vi
+from helpers import TEXT, make_session
+
+
+@pytest.fixture
+def reports(tokenizer, monkeypatch):
+    monkeypatch.setattr(attention_jobs, "load_model", lambda name: make_session(tokenizer, name))
+    calls = []
+    write_report = attention_jobs.write_report
+
+    def record(session, text, output_file, memory_budget_mb=None, offline=False):
+        calls.append((text, memory_budget_mb))
+        return write_report(session, text, output_file, memory_budget_mb, offline)
+
+    monkeypatch.setattr(attention_jobs, "write_report", record)
+    return calls
+
+
+@pytest.fixture
+def blocked(monkeypatch):
+    # Holds every report in its worker thread until released
+    started, release = threading.Event(), threading.Event()
+    write_report = attention_jobs.write_report
+
+    def blocking(*args):
+        started.set()
+        release.wait(timeout=10)
+        return write_report(*args)
+
+    monkeypatch.setattr(attention_jobs, "write_report", blocking)
+    return started, release
+
+
+def _queue(tmp_path, **kwargs):
+    return attention_jobs.AttentionJobQueue("tiny-gpt2", output_dir=str(tmp_path), **kwargs)
+
+
+def test_identical_requests_share_one_job(reports, tmp_path):
+    async def run():
+        async with _queue(tmp_path) as queue:
+            first = await queue.submit(TEXT)
+            second = await queue.submit(TEXT)
+            other = await queue.submit("Hello world")
+            return first, second, other, await first, await other
+
+    first, second, other, path, other_path = asyncio.run(run())
+
+    assert first is second and first is not other
+    assert os.path.exists(path) and path != other_path
+    assert sorted(text for text, _ in reports) == sorted([TEXT, "Hello world"])
+
+
+def test_memory_budget_is_split_between_workers(reports, tmp_path):
+    async def run():
+        async with _queue(tmp_path, pool_size=2, memory_budget_mb=64) as queue:
+            await (await queue.submit(TEXT))
+
+    asyncio.run(run())
+
+    assert reports == [(TEXT, 32)]
+
+
+def test_cancelled_running_job_leaves_no_report(reports, blocked, tmp_path):
+    started, release = blocked
+
+    async def run():
+        async with _queue(tmp_path, pool_size=1) as queue:
+            job = await queue.submit(TEXT)
+            await asyncio.to_thread(started.wait, 10)
+            job.cancel()
+            release.set()
+            await queue.close()
+            return job
+
+    job = asyncio.run(run())
+
+    assert job.future.cancelled()
+    assert not os.path.exists(job.output_file)
+
+
+def test_cancelled_pending_job_is_skipped(reports, blocked, tmp_path):
+    started, release = blocked
+
+    async def run():
+        async with _queue(tmp_path, pool_size=1) as queue:
+            running = await queue.submit(TEXT)
+            await asyncio.to_thread(started.wait, 10)
+            pending = await queue.submit("Hello world")
+            pending.cancel()
+            release.set()
+            return await running, pending
+
+    path, pending = asyncio.run(run())
+
+    assert os.path.exists(path)
+    assert pending.future.cancelled()
+    assert [text for text, _ in reports] == [TEXT]
+
+
+def test_full_queue_raises_without_waiting(reports, blocked, tmp_path):
+    started, release = blocked
+
+    async def run():
+        async with _queue(tmp_path, pool_size=1, max_pending=1) as queue:
+            await queue.submit(TEXT)
+            await asyncio.to_thread(started.wait, 10)
+            await queue.submit("Hello world")
+            try:
+                with pytest.raises(asyncio.QueueFull):
+                    await queue.submit("Attention heads", wait=False)
+                assert queue.pending == 1
+            finally:
+                release.set()
+            # A rejected request is not deduplicated against later ones
+            return await (await queue.submit("Attention heads"))
+
+    assert os.path.exists(asyncio.run(run()))
+
+
+def test_concurrent_writes_to_one_path_do_not_collide(monkeypatch, tmp_path):
+    # Both writers are held mid-page until the other has started too
+    barrier = threading.Barrier(2, timeout=10)
+    write_json_items = vi._write_json_items
+
+    def together(f, data):
+        if data.get("tokens"):
+            barrier.wait()
+        write_json_items(f, data)
+
+    monkeypatch.setattr(vi, "_write_json_items", together)
+    output_file = str(tmp_path / "report.html")
+    with ThreadPoolExecutor(2) as pool:
+        paths = list(pool.map(lambda n: vi.write_html({"tokens": [str(n)]}, output_file), range(2)))
+
+    assert paths == [os.path.abspath(output_file)] * 2
+    assert os.listdir(tmp_path) == ["report.html"]
+
+
+def test_failed_write_leaves_no_temporary_file(monkeypatch, tmp_path):
+    def fail(*args):
+        raise MemoryError
+
+    monkeypatch.setattr(vi, "_write_json_rows", fail)
+    with pytest.raises(MemoryError):
+        vi.write_html({"tokens": []}, str(tmp_path / "report.html"), attention=np.zeros((1, 1, 1, 1)))
+
+    assert os.listdir(tmp_path) == []
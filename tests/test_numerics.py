@@ -0,0 +1,129 @@
+import copy
+import gc
+import weakref
+
+import numpy as np
+import pytest
+import torch
+
+import visualize_interactive as vi
+from helpers import TEXT
+
+ROW_SUM_ATOL = 1e-5
+
+
+def test_compute_entropy_reference_values():
+    uniform = np.full(4, 0.25)
+    one_hot = np.array([1.0, 0.0, 0.0, 0.0])
+    mixed = np.array([0.5, 0.25, 0.25])
+
+    assert vi.compute_entropy(uniform) == pytest.approx(np.log(4), abs=1e-8)
+    assert vi.compute_entropy(one_hot) == pytest.approx(0.0, abs=1e-8)
+    assert vi.compute_entropy(mixed) == pytest.approx(1.5 * np.log(2), abs=1e-8)
+
+
+def test_compute_entropy_is_vectorized_over_leading_axes():
+    rng = np.random.default_rng(0)
+    weights = rng.random((2, 3, 5, 5))
+    weights /= weights.sum(axis=-1, keepdims=True)
+
+    expected = np.array([[[vi.compute_entropy(row) for row in head] for head in layer] for layer in weights])
+    np.testing.assert_allclose(vi.compute_entropy(weights), expected, rtol=1e-12)
+
+
+def test_head_entropy_matches_per_head_loop():
+    rng = np.random.default_rng(1)
+    attention = rng.random((3, 4, 6, 6)).astype(np.float32)
+    attention /= attention.sum(axis=-1, keepdims=True)
+
+    expected = [[float(np.mean(vi.compute_entropy(head))) for head in layer] for layer in attention]
+    np.testing.assert_allclose(vi.head_entropy(attention), expected, rtol=1e-6)
+
+
+def _baseline(session, text=TEXT):
+    tokenizer, model, _ = session
+    input_ids, _ = vi.tokenize(tokenizer, text)
+    with torch.no_grad():
+        outputs = model(input_ids, output_attentions=True)
+    return input_ids, torch.stack(outputs.attentions).squeeze(1).numpy()
+
+
+def test_extraction_matches_model_output(session):
+    input_ids, baseline = _baseline(session)
+    attention, layers = vi.extract_attention(session[1], input_ids)
+
+    assert layers == list(range(baseline.shape[0]))
+    assert attention.dtype == np.float32
+    np.testing.assert_array_equal(attention, baseline)
+
+
+def test_extracted_rows_sum_to_one(session):
+    input_ids, _ = _baseline(session)
+    attention, _ = vi.extract_attention(session[1], input_ids)
+
+    np.testing.assert_allclose(attention.sum(axis=-1), 1.0, atol=ROW_SUM_ATOL)
+
+
+def test_extracted_attention_is_causally_masked(session):
+    input_ids, _ = _baseline(session)
+    attention, _ = vi.extract_attention(session[1], input_ids)
+
+    future = ~np.tri(attention.shape[-1], dtype=bool)
+    assert np.all(attention[..., future] == 0)
+
+
+def test_display_tokens_cover_source_text(tokenizer):
+    text = "Hello  world,\nthe quick fox"
+    input_ids, display_tokens = vi.tokenize(tokenizer, text)
+
+    assert len(display_tokens) == input_ids.shape[1]
+    assert "".join(display_tokens) == text.replace("\n", "\\n")
+
+
+def test_display_tokens_carry_each_character_once(tokenizer):
+    # Byte-level BPE splits each of these characters into three byte pieces
+    text = "日本語 ok"
+    input_ids, display_tokens = vi.tokenize(tokenizer, text)
+
+    assert len(display_tokens) == input_ids.shape[1]
+    assert display_tokens[:3] == ["日", "", ""]
+    assert "".join(display_tokens) == text
+
+
+@pytest.mark.parametrize("text, bare_marker", [
+    ("12 apples", True), ("zebra x", True), ("日本語 ok", True), ("The  quick\nfox", False),
+])
+def test_sentencepiece_display_tokens_cover_source_text(metaspace_tokenizer, text, bare_marker):
+    # Digits, unknown words and non-ASCII text do not merge with the prepended '▁',
+    # which then shares its offsets with the first character
+    input_ids, display_tokens = vi.tokenize(metaspace_tokenizer, text)
+    pieces = metaspace_tokenizer.convert_ids_to_tokens(input_ids[0].tolist())
+
+    assert len(display_tokens) == len(pieces)
+    assert (pieces[0] == "▁") == bare_marker
+    if bare_marker:
+        # Shown as the space it stands for; the remaining labels are the source text
+        assert display_tokens[0] == " "
+        display_tokens = display_tokens[1:]
+    assert "".join(display_tokens) == text.replace("\n", "\\n")
+
+
+def test_tokenize_batch_matches_single_calls(tokenizer):
+    texts = [TEXT, "Hello world", TEXT]
+    batch = vi.tokenize_batch(tokenizer, texts)
+
+    for text, (input_ids, display_tokens) in zip(texts, batch):
+        single_ids, single_tokens = vi.tokenize(tokenizer, text)
+        assert torch.equal(input_ids, single_ids)
+        assert display_tokens == single_tokens
+
+
+def test_token_cache_does_not_keep_tokenizers_alive(tokenizer):
+    retired = copy.copy(tokenizer)
+    vi.tokenize(retired, TEXT)
+    ref = weakref.ref(retired)
+
+    del retired
+    gc.collect()
+
+    assert ref() is None
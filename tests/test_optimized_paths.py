@@ -0,0 +1,287 @@
+import json
+import re
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import visualize_interactive as vi
+from helpers import PERTURBED_TEXT, TEXT, make_session
+
+# Tolerances against the fp32 dense baseline
+CHUNKED_ATOL = 1e-6
+ROUNDED_ATOL = 0.5e-4 + 1e-6  # payloads rounded to 4 decimals
+
+
+@pytest.fixture
+def baseline(session):
+    input_ids, _ = vi.tokenize(session[0], TEXT)
+    attention, _ = vi.extract_attention(session[1], input_ids)
+    return input_ids, attention
+
+
+def _page_data(path):
+    html = path.read_text(encoding="utf-8")
+    return json.loads(re.search(r"const DATA = (.*?);\n", html).group(1))
+
+
+def _page_data_for(session, tmp_path, **kwargs):
+    output_file = tmp_path / "report.html"
+    vi.write_report(session, TEXT, str(output_file), **kwargs)
+    return _page_data(output_file)
+
+
+def test_plan_without_budget_keeps_everything(session):
+    plan = vi.plan_extraction(session[1].config, 64)
+
+    assert plan == {"layers": [0, 1, 2], "chunk_size": 64, "spill": False}
+
+
+def _summary_budget(config, layers):
+    # One layer of entropy and summary work plus room for the given number of layer summaries
+    layer_tensor, layer_summary = vi.estimate_attention_bytes(config, 64, 1, dense=False, top_k=5)
+    return layer_tensor // vi.ATTENTION_BYTES_PER_VALUE * vi.WORKING_BYTES_PER_VALUE + int(layer_summary * layers)
+
+
+def test_plan_under_budget_drops_layers_to_fit_summary(session):
+    config = session[1].config
+
+    assert vi.plan_extraction(config, 64, _summary_budget(config, 1.5), dense=False, top_k=5)["layers"] == [0]
+    assert vi.plan_extraction(config, 64, _summary_budget(config, 2.5), dense=False, top_k=5)["layers"] == [0, 2]
+
+
+def test_estimate_counts_summary_payload(session):
+    config = session[1].config
+    _, dense_payload = vi.estimate_attention_bytes(config, 10, 1)
+    _, summary_payload = vi.estimate_attention_bytes(config, 10, 1, dense=False, top_k=5)
+    _, both_payload = vi.estimate_attention_bytes(config, 10, 1, top_k=5)
+
+    # Short prompts: the summary is larger than the dense matrix it summarizes
+    assert summary_payload > dense_payload
+    assert both_payload == dense_payload + summary_payload
+
+
+def test_dense_plan_keeps_the_layers_of_the_sparse_plan(session):
+    # The dense matrix is streamed into the page row by row, so it does not cost layers
+    config = session[1].config
+    budget = _summary_budget(config, 1.5)
+
+    assert vi.plan_extraction(config, 64, budget, top_k=5) == vi.plan_extraction(config, 64, budget, dense=False, top_k=5)
+
+
+def test_plan_rejects_budget_below_one_layer(session):
+    with pytest.raises(MemoryError):
+        vi.plan_extraction(session[1].config, 64, memory_budget=1024)
+
+
+def test_chunked_spilled_extraction_matches_baseline(session, tokenizer):
+    # Deep enough that the forward pass over every layer outweighs the work on one layer
+    _, model, _ = make_session(tokenizer, session[2], num_layers=12)
+    input_ids, _ = vi.tokenize(tokenizer, TEXT)
+    expected, _ = vi.extract_attention(model, input_ids)
+    layer_tensor, _ = vi.estimate_attention_bytes(model.config, input_ids.shape[1], 1, dense=False)
+    memory_budget = layer_tensor * 6
+    plan = vi.plan_extraction(model.config, input_ids.shape[1], memory_budget, dense=False)
+    assert plan["chunk_size"] < input_ids.shape[1]
+    assert plan["spill"]
+
+    attention, layers = vi.extract_attention(model, input_ids, memory_budget, dense=False)
+
+    assert isinstance(attention, np.memmap)
+    assert layers == list(range(12))
+    np.testing.assert_allclose(attention, expected, atol=CHUNKED_ATOL)
+
+
+def test_head_entropy_averages_selected_rows(baseline):
+    _, attention = baseline
+    rows = np.array([1, 3, 4])
+
+    expected = vi.compute_entropy(attention)[..., rows].mean(axis=-1)
+    np.testing.assert_allclose(vi.head_entropy(attention, rows), expected, rtol=1e-6)
+
+
+def test_layer_selection_matches_baseline(session, baseline):
+    input_ids, expected = baseline
+    attention, layers = vi.extract_attention(session[1], input_ids, layers=[2, 0])
+
+    np.testing.assert_array_equal(attention, expected[[2, 0]])
+
+
+def test_summary_matches_dense_attention(baseline):
+    _, attention = baseline
+    summary = vi.summarize_attention(attention, top_k=3)
+    diagonal = np.diagonal(attention, axis1=-2, axis2=-1)
+
+    np.testing.assert_allclose(summary["incoming"], attention.sum(axis=-2) - diagonal, atol=ROUNDED_ATOL)
+    np.testing.assert_allclose(summary["outgoing"], 1 - diagonal, atol=ROUNDED_ATOL)
+
+    expected_targets = -np.sort(-attention, axis=-1)[..., :3]
+    np.testing.assert_allclose(summary["target_value"], expected_targets, atol=ROUNDED_ATOL)
+    index = np.array(summary["target_index"])
+    gathered = np.where(index >= 0, np.take_along_axis(attention, np.maximum(index, 0), axis=-1), 0)
+    np.testing.assert_allclose(gathered, summary["target_value"], atol=ROUNDED_ATOL)
+
+
+def test_summary_pads_rows_without_enough_visible_tokens(baseline):
+    _, attention = baseline
+    summary = vi.summarize_attention(attention, top_k=3)
+
+    assert summary["target_index"][0][0][0] == [0, -1, -1]
+    assert summary["source_index"][0][0][-1][1:] == [-1, -1]
+
+
+def test_report_payload_matches_baseline(session, baseline, tmp_path):
+    _, expected = baseline
+    data = _page_data_for(session, tmp_path, dense=True)
+
+    np.testing.assert_allclose(data["attention"], expected, atol=CHUNKED_ATOL)
+    np.testing.assert_allclose(data["entropy"], vi.head_entropy(expected), rtol=1e-6)
+
+
+def test_sparse_report_keeps_top_k_values(session, baseline, tmp_path):
+    _, expected = baseline
+    data = _page_data_for(session, tmp_path, dense=False)
+
+    assert "attention" not in data
+    expected_targets = -np.sort(-expected, axis=-1)[..., :5]
+    np.testing.assert_allclose(data["summary"]["target_value"], expected_targets, atol=ROUNDED_ATOL)
+
+
+@pytest.mark.parametrize("dense", [True, False])
+def test_budgeted_report_peak_stays_within_budget(session, tmp_path, dense):
+    text = " ".join([TEXT] * 10)
+    memory_budget_mb = 2
+    input_ids, _ = vi.tokenize(session[0], text)
+    plan = vi.plan_extraction(session[1].config, input_ids.shape[1], memory_budget_mb * 2**20, dense=dense, top_k=5)
+    assert plan["spill"] and len(plan["layers"]) < session[1].config.num_hidden_layers
+
+    # tracemalloc sees numpy arrays and Python objects, not torch tensors or the spill file
+    tracemalloc.start()
+    try:
+        vi.write_report(session, text, str(tmp_path / "report.html"), memory_budget_mb, dense=dense)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert peak <= memory_budget_mb * 2**20
+
+
+def test_diff_of_identical_inputs_is_zero(session, monkeypatch, tmp_path):
+    monkeypatch.setitem(vi._SESSIONS, session[2], session)
+    output_file = tmp_path / "diff.html"
+    vi.visualize_diff(session[2], TEXT, output_file=str(output_file))
+    data = _page_data(output_file)
+
+    assert np.all(np.array(data["attention"]) == 0)
+    assert np.all(np.array(data["entropy"]) == 0)
+
+
+def test_diff_matches_aligned_baseline(session, tokenizer, monkeypatch, tmp_path):
+    other = make_session(tokenizer, session[2], seed=1)
+    monkeypatch.setitem(vi._SESSIONS, "base", session)
+    monkeypatch.setitem(vi._SESSIONS, "tuned", other)
+    output_file = tmp_path / "diff.html"
+    vi.visualize_diff("base", TEXT, model_name_b="tuned", text_b=PERTURBED_TEXT, output_file=str(output_file))
+    data = _page_data(output_file)
+
+    input_ids_a, tokens_a = vi.tokenize(tokenizer, TEXT)
+    input_ids_b, tokens_b = vi.tokenize(tokenizer, PERTURBED_TEXT)
+    attention_a, _ = vi.extract_attention(session[1], input_ids_a)
+    attention_b, _ = vi.extract_attention(other[1], input_ids_b)
+    idx_a, idx_b = vi.align_tokens(tokens_a, tokens_b)
+    expected = attention_b[:, :, idx_b[:, None], idx_b] - attention_a[:, :, idx_a[:, None], idx_a]
+
+    assert data["tokens"] == [tokens_b[i] for i in idx_b]
+    np.testing.assert_allclose(data["attention"], expected, atol=ROUNDED_ATOL)
+    np.testing.assert_allclose(
+        data["entropy"], vi.head_entropy(attention_b, idx_b) - vi.head_entropy(attention_a, idx_a), atol=ROUNDED_ATOL
+    )
+
+
+def test_iter_attention_tokenizes_in_batches(session, monkeypatch):
+    import attention_export
+
+    batches = []
+    tokenize_batch = attention_export.tokenize_batch
+
+    def record(tokenizer, texts):
+        batches.append(texts)
+        return tokenize_batch(tokenizer, texts)
+
+    monkeypatch.setattr(attention_export, "TOKENIZE_BATCH_SIZE", 2)
+    monkeypatch.setattr(attention_export, "tokenize_batch", record)
+    texts = [TEXT, PERTURBED_TEXT, TEXT, "Hello world", PERTURBED_TEXT]
+
+    results = list(attention_export.iter_attention(session, texts, prompt_ids="abcde"))
+
+    assert batches == [texts[:2], texts[2:4], texts[4:]]
+    assert [prompt_id for prompt_id, *_ in results] == list("abcde")
+    assert [tokens for _, tokens, *_ in results] == [vi.tokenize(session[0], text)[1] for text in texts]
+
+
+def test_iter_attention_rejects_mismatched_prompt_ids(session):
+    from attention_export import iter_attention
+
+    with pytest.raises(ValueError):
+        next(iter_attention(session, [TEXT, TEXT], prompt_ids=[0]))
+
+
+def test_columnar_export_matches_baseline(session, baseline, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    from attention_export import export_columnar
+
+    _, expected = baseline
+    paths = export_columnar(session, [TEXT], str(tmp_path))
+    table = pq.read_table(paths["attention"]).to_pydict()
+
+    dense = np.zeros_like(expected)
+    dense[table["layer"], table["head"], table["q"], table["k"]] = table["value"]
+    np.testing.assert_array_equal(dense, expected)
+
+    entropy = pq.read_table(paths["entropy"]).to_pydict()
+    np.testing.assert_allclose(
+        np.array(entropy["entropy"]).reshape(expected.shape[:3]), vi.compute_entropy(expected), rtol=1e-6
+    )
+
+
+def test_columnar_export_threshold_drops_small_values(session, baseline, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    from attention_export import export_columnar
+
+    _, expected = baseline
+    paths = export_columnar(session, [TEXT], str(tmp_path), threshold=0.1)
+    values = np.array(pq.read_table(paths["attention"]).column("value"))
+
+    assert np.all(values >= 0.1)
+    assert len(values) == np.count_nonzero(expected >= 0.1)
+
+
+def test_columnar_export_buffers_row_groups(session, baseline, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+    from attention_export import export_columnar
+
+    _, expected = baseline
+    rows = int(np.tri(expected.shape[-1]).sum()) * expected.shape[1] * 2
+    parquet = export_columnar(session, [TEXT, TEXT], str(tmp_path / "parquet"), row_group_size=1000)
+    arrow = export_columnar(session, [TEXT, TEXT], str(tmp_path / "arrow"), format="arrow", row_group_size=1000)
+
+    metadata = pq.ParquetFile(parquet["attention"]).metadata
+    sizes = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+    assert sum(sizes) == rows * expected.shape[0]
+    assert all(size == 1000 for size in sizes[:-1])
+
+    with pa.ipc.open_file(arrow["attention"]) as reader:
+        assert [reader.get_batch(i).num_rows for i in range(reader.num_record_batches)] == sizes
+        assert reader.read_all().equals(pq.read_table(parquet["attention"]))
+
+
+def test_zarr_export_matches_baseline(session, baseline, tmp_path):
+    zarr = pytest.importorskip("zarr")
+    from attention_export import export_zarr
+
+    _, expected = baseline
+    export_zarr(session, [TEXT], str(tmp_path))
+
+    np.testing.assert_array_equal(zarr.open_array(str(tmp_path / "0" / "attention"))[:], expected)
@@ -1,6 +1,10 @@
 import torch
+import difflib
 import json
 import os
+import tempfile
+import threading
+import weakref
 import numpy as np
 from transformers import AutoModelForCausalLM, AutoTokenizer
 
@@ -11,73 +15,656 @@ def compute_entropy(attention_weights):
     return entropy
 
 
-def visualize_interactive(model_name="Qwen/Qwen2.5-0.5B", text=None):
+_SESSIONS = {}
+
+
+def load_model(model_name):
     print(f"Loading model: {model_name}...")
     try:
         tokenizer = AutoTokenizer.from_pretrained(model_name)
         model = AutoModelForCausalLM.from_pretrained(model_name, output_attentions=True)
+        resolved_name = model_name
     except Exception as e:
         print(f"Error loading model {model_name}: {e}")
         print("Trying fallback model: gpt2")
-        model_name = "gpt2"
-        tokenizer = AutoTokenizer.from_pretrained(model_name)
-        model = AutoModelForCausalLM.from_pretrained(model_name, output_attentions=True)
+        resolved_name = "gpt2"
+        tokenizer = AutoTokenizer.from_pretrained(resolved_name)
+        model = AutoModelForCausalLM.from_pretrained(resolved_name, output_attentions=True)
+    model.eval()
+    return tokenizer, model, resolved_name
 
-    if text is None:
-        text = "The quick brown fox jumps over the lazy dog."
 
-    print(f"Processing text: '{text}'")
-    inputs = tokenizer(text, return_tensors="pt")
+def load_session(model_name):
+    if model_name in _SESSIONS:
+        return _SESSIONS[model_name]
 
-    tokens = tokenizer.convert_ids_to_tokens(inputs.input_ids[0])
-    display_tokens = [t.replace('Ġ', ' ').replace('Ċ', '\\n') for t in tokens]
+    session = load_model(model_name)
+    _SESSIONS[model_name] = session
+    _SESSIONS.setdefault(session[2], session)
+    return session
 
-    with torch.no_grad():
-        outputs = model(**inputs)
 
-    attentions = outputs.attentions
-    num_layers = len(attentions)
-    num_heads = attentions[0].shape[1]
+# Rough per-value costs, measured with tracemalloc: float32 in the retained array, a Python
+# float plus list slot from .tolist() together with its JSON text in the page payload, and
+# the float32 temporaries of entropy and summary work on one layer
+ATTENTION_BYTES_PER_VALUE = 4
+PAYLOAD_BYTES_PER_VALUE = 72
+WORKING_BYTES_PER_VALUE = 12
 
-    print(f"Model has {num_layers} layers and {num_heads} heads per layer")
 
-    all_attention_data = []
-    entropy_data = []
-    
-    for layer_idx in range(num_layers):
-        layer_attention = attentions[layer_idx].squeeze(0).numpy().tolist()
-        all_attention_data.append(layer_attention)
-        
-        layer_np = attentions[layer_idx].squeeze(0).numpy()
-        layer_entropy = []
-        for head_idx in range(num_heads):
-            head_attention = layer_np[head_idx]
-            head_entropy = compute_entropy(head_attention)
-            avg_entropy = float(np.mean(head_entropy))
-            layer_entropy.append(avg_entropy)
-        entropy_data.append(layer_entropy)
+def get_memory_budget(memory_budget_mb=None):
+    if memory_budget_mb is None:
+        memory_budget_mb = os.environ.get("ATTENTION_MEMORY_BUDGET_MB")
+    if memory_budget_mb is None:
+        return None
+    return int(float(memory_budget_mb) * 1024 * 1024)
+
+
+def estimate_attention_bytes(config, seq_len, num_layers=None, dense=True, top_k=None):
+    if num_layers is None:
+        num_layers = config.num_hidden_layers
+    values = num_layers * config.num_attention_heads * seq_len * seq_len
+    payload_values = values if dense else 0
+    if top_k is not None:
+        # Per query: incoming and outgoing mass plus top-k indices and values for targets and sources
+        payload_values += num_layers * config.num_attention_heads * seq_len * (2 + 4 * min(top_k, seq_len))
+    return values * ATTENTION_BYTES_PER_VALUE, payload_values * PAYLOAD_BYTES_PER_VALUE
+
+
+def plan_extraction(config, seq_len, memory_budget=None, layers=None, dense=True, top_k=None):
+    num_layers = config.num_hidden_layers
+    if layers is None:
+        layers = list(range(num_layers))
+    plan = {"layers": list(layers), "chunk_size": seq_len, "spill": False}
+    if memory_budget is None:
+        return plan
+
+    # The summary payload is held for every captured layer; the dense matrix is streamed into
+    # the page one row at a time, after the per-layer entropy and summary temporaries are freed
+    layer_tensor, layer_summary = estimate_attention_bytes(config, seq_len, 1, dense=False, top_k=top_k)
+    row_dense = seq_len * PAYLOAD_BYTES_PER_VALUE if dense else 0
+    layer_work = max(layer_tensor // ATTENTION_BYTES_PER_VALUE * WORKING_BYTES_PER_VALUE, row_dense)
+    row_bytes = num_layers * config.num_attention_heads * seq_len * ATTENTION_BYTES_PER_VALUE
+
+    # Unchunked forward pass output for every layer, the retained copy, the payload and one layer of work
+    full = layer_tensor * num_layers + (layer_tensor + layer_summary) * len(layers) + layer_work
+    if full <= memory_budget:
+        return plan
+
+    if layer_work >= memory_budget:
+        raise MemoryError(
+            f"Processing one layer of {seq_len} tokens needs ~{layer_work / 2**20:.1f} MB, "
+            f"over the {memory_budget / 2**20:.1f} MB budget"
+        )
+    available = memory_budget - layer_work
+
+    # Keep as many evenly spaced layers as their summary payload allows
+    if layer_summary:
+        max_layers = int(available // layer_summary)
+        if max_layers == 0:
+            raise MemoryError(
+                f"The summary of one layer of {seq_len} tokens does not fit the "
+                f"{memory_budget / 2**20:.1f} MB budget"
+            )
+        if max_layers < len(layers):
+            picks = np.linspace(0, len(layers) - 1, max_layers).round().astype(int)
+            plan["layers"] = [layers[i] for i in picks]
+        available -= layer_summary * len(plan["layers"])
+
+    # The retained attention array stays in RAM if it fits next to the payload, otherwise it is spilled
+    retained = layer_tensor * len(plan["layers"])
+    plan["spill"] = retained > available
+
+    # During the forward pass, what the retained array leaves holds one chunk of query rows
+    # across every layer
+    forward_budget = memory_budget - (0 if plan["spill"] else retained)
+    plan["chunk_size"] = max(1, min(seq_len, int(forward_budget // row_bytes)))
+    return plan
+
+
+# Entries per tokenizer. The per-tokenizer caches are held weakly, so tokenizers that are
+# no longer used (e.g. from a closed AttentionJobQueue) are not kept alive by them
+TOKEN_CACHE_SIZE = 4096
+_TOKEN_CACHE = weakref.WeakKeyDictionary()
+_TOKEN_CACHE_LOCK = threading.Lock()
+
+
+def _token_cache(tokenizer):
+    with _TOKEN_CACHE_LOCK:
+        cache = _TOKEN_CACHE.get(tokenizer)
+        if cache is None:
+            cache = _TOKEN_CACHE[tokenizer] = {}
+        return cache
+
+
+def _display_tokens(tokenizer, text, ids, offsets, special_mask):
+    if offsets is None:
+        tokens = tokenizer.convert_ids_to_tokens(ids)
+        return [t.replace('Ġ', ' ').replace('▁', ' ').replace('Ċ', '\\n') for t in tokens]
+
+    pieces = tokenizer.convert_ids_to_tokens(ids)
+    display_tokens = []
+    prev_end = 0
+    for i, (piece, (start, end), special) in enumerate(zip(pieces, offsets, special_mask)):
+        if special:
+            display_tokens.append(piece)
+            continue
+        # A bare word marker (SentencePiece's prepended '▁') shares its span with the
+        # token after it, which carries the text; the marker is labelled from itself
+        if piece.strip('▁Ġ') == '' and i + 1 < len(offsets) and offsets[i + 1][0] < end:
+            display_tokens.append(' ' * len(piece))
+            continue
+        # Starting from the previous token's end keeps whitespace the tokenizer
+        # trimmed from this token's offsets; of byte pieces sharing one character's
+        # span, only the first carries it
+        if end > prev_end:
+            span = text[prev_end:end]
+        elif start > prev_end:
+            span = text[prev_end:start]
+        else:
+            span = ''
+        display_tokens.append(span.replace('\n', '\\n'))
+        prev_end = max(prev_end, start, end)
+    return display_tokens
+
+
+def tokenize_batch(tokenizer, texts):
+    cache = _token_cache(tokenizer)
+    entries = {}
+    misses = []
+    for text in dict.fromkeys(texts):
+        entry = cache.get(text)
+        if entry is None:
+            misses.append(text)
+        else:
+            entries[text] = entry
+
+    if misses:
+        use_offsets = getattr(tokenizer, "is_fast", False)
+        encoded = tokenizer(misses, return_offsets_mapping=use_offsets, return_special_tokens_mask=True)
+        for i, text in enumerate(misses):
+            ids = encoded["input_ids"][i]
+            offsets = encoded["offset_mapping"][i] if use_offsets else None
+            display_tokens = _display_tokens(tokenizer, text, ids, offsets, encoded["special_tokens_mask"][i])
+            entry = (tuple(ids), tuple(display_tokens))
+            entries[text] = entry
+            with _TOKEN_CACHE_LOCK:
+                while len(cache) >= TOKEN_CACHE_SIZE:
+                    del cache[next(iter(cache))]
+                cache[text] = entry
+
+    return [(torch.tensor([entries[text][0]]), list(entries[text][1])) for text in texts]
+
+
+def tokenize(tokenizer, text):
+    return tokenize_batch(tokenizer, [text])[0]
+
+
+def allocate_attention(shape, spill=False):
+    if spill:
+        return np.memmap(tempfile.TemporaryFile(), dtype=np.float32, mode="w+", shape=shape)
+    return np.zeros(shape, dtype=np.float32)
+
+
+def extract_attention(model, input_ids, memory_budget=None, layers=None, dense=True, top_k=None):
+    seq_len = input_ids.shape[1]
+    plan = plan_extraction(model.config, seq_len, memory_budget, layers, dense, top_k)
+    layers, chunk_size = plan["layers"], plan["chunk_size"]
+    if len(layers) < model.config.num_hidden_layers:
+        print(f"Memory budget: capturing {len(layers)} of {model.config.num_hidden_layers} layers")
+
+    # (layers, heads, seq, seq) in a single array instead of per-layer lists
+    shape = (len(layers), model.config.num_attention_heads, seq_len, seq_len)
+    if plan["spill"]:
+        print("Memory budget: spilling attention to a temporary file")
+    attention = allocate_attention(shape, plan["spill"])
+
+    # Query rows are run in chunks against the KV cache so only one chunk of
+    # attention probabilities is alive at a time
+    past_key_values = None
+    for start in range(0, seq_len, chunk_size):
+        stop = min(start + chunk_size, seq_len)
+        with torch.no_grad():
+            outputs = model(input_ids[:, start:stop], past_key_values=past_key_values,
+                            use_cache=True, output_attentions=True)
+        past_key_values = outputs.past_key_values
+        for i, layer in enumerate(layers):
+            attention[i, :, start:stop, :stop] = outputs.attentions[layer][0].float().numpy()
+        del outputs
+
+    return attention, layers
+
+
+def head_entropy(attention, rows=None):
+    # One layer at a time: compute_entropy makes several full-size temporaries.
+    # With rows, only those query rows are averaged
+    if rows is None:
+        rows = slice(None)
+    return np.array([compute_entropy(np.asarray(layer)[:, rows]).mean(axis=-1) for layer in attention])
+
+
+def _rounded(values, precision):
+    return np.round(np.asarray(values, dtype=np.float64), precision).tolist()
+
+
+def _ranked(values, visible, top_k, by_magnitude):
+    # Scratch copy of one layer; future positions are excluded from the rankings
+    scores = np.empty(values.shape, dtype=np.float32)
+    if by_magnitude:
+        np.abs(values, out=scores)
+    else:
+        np.copyto(scores, values)
+    scores[:, ~visible] = -np.inf
+
+    # Repeated argmax keeps the index arrays at top-k size, unlike a full argsort/argpartition
+    index = np.empty(scores.shape[:-1] + (top_k,), dtype=np.int64)
+    for j in range(top_k):
+        best = scores.argmax(axis=-1)[..., None]
+        # Rows with fewer than top_k visible positions are padded with -1
+        found = np.take_along_axis(scores, best, axis=-1) > -np.inf
+        index[..., j] = np.where(found, best, -1)[..., 0]
+        np.put_along_axis(scores, best, -np.inf, axis=-1)
+
+    ranked_values = np.take_along_axis(values, np.maximum(index, 0), axis=-1)
+    return index, np.where(index >= 0, ranked_values, 0)
+
+
+def summarize_attention(attention, top_k=5, by_magnitude=False, precision=4):
+    num_layers, num_heads, seq_len = attention.shape[:3]
+    top_k = min(top_k, seq_len)
+    visible = np.tri(seq_len, dtype=bool)
+
+    shape = (num_layers, num_heads, seq_len)
+    incoming = np.empty(shape, dtype=np.float32)
+    outgoing = np.empty(shape, dtype=np.float32)
+    targets = np.empty(shape + (top_k,), dtype=np.int64)
+    sources = np.empty(shape + (top_k,), dtype=np.int64)
+    target_values = np.empty(shape + (top_k,), dtype=np.float32)
+    source_values = np.empty(shape + (top_k,), dtype=np.float32)
+
+    # One layer at a time, so a spilled array is never loaded into memory as a whole
+    for i in range(num_layers):
+        layer = np.asarray(attention[i])
+        # Mass exchanged with other tokens, so self-attention does not dominate the ranking
+        diagonal = np.diagonal(layer, axis1=-2, axis2=-1)
+        incoming[i] = layer.sum(axis=-2) - diagonal
+        outgoing[i] = layer.sum(axis=-1) - diagonal
+        targets[i], target_values[i] = _ranked(layer, visible, top_k, by_magnitude)
+        sources[i], source_values[i] = _ranked(layer.swapaxes(-1, -2), visible.T, top_k, by_magnitude)
+
+    return {
+        "top_k": top_k,
+        "incoming": _rounded(incoming, precision),
+        "outgoing": _rounded(outgoing, precision),
+        "target_index": targets.tolist(),
+        "target_value": _rounded(target_values, precision),
+        "source_index": sources.tolist(),
+        "source_value": _rounded(source_values, precision)
+    }
+
+
+def write_report(session, text, output_file="attention_interactive.html", memory_budget_mb=None,
+                 offline=False, dense=True, top_k=5):
+    tokenizer, model, model_name = session
+
+    print(f"Processing text: '{text}'")
+    input_ids, display_tokens = tokenize(tokenizer, text)
+    attention, layers = extract_attention(model, input_ids, get_memory_budget(memory_budget_mb),
+                                          dense=dense, top_k=top_k)
+    num_layers, num_heads = attention.shape[:2]
+
+    print(f"Model has {model.config.num_hidden_layers} layers and {num_heads} heads per layer")
 
     viz_data = {
         "tokens": display_tokens,
-        "attention": all_attention_data,
-        "entropy": entropy_data,
+        "entropy": head_entropy(attention).tolist(),
+        "summary": summarize_attention(attention, top_k),
+        "layers": layers,
         "num_layers": num_layers,
         "num_heads": num_heads,
         "model_name": model_name
     }
 
     print("Generating interactive visualization...")
-    html_content = generate_html(viz_data)
+    return write_html(viz_data, output_file, offline, attention if dense else None)
 
-    output_file = "attention_interactive.html"
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.write(html_content)
 
-    print(f"Interactive visualization saved to {os.path.abspath(output_file)}")
+def visualize_interactive(model_name="Qwen/Qwen2.5-0.5B", text=None,
+                          output_file="attention_interactive.html", memory_budget_mb=None,
+                          offline=False, dense=True, top_k=5):
+    session = load_session(model_name)
 
+    if text is None:
+        text = "The quick brown fox jumps over the lazy dog."
 
-def generate_html(data):
-    data_json = json.dumps(data)
+    output_path = write_report(session, text, output_file, memory_budget_mb, offline, dense, top_k)
+    print(f"Interactive visualization saved to {output_path}")
+
+
+def align_tokens(tokens_a, tokens_b):
+    matcher = difflib.SequenceMatcher(None, tokens_a, tokens_b, autojunk=False)
+    idx_a, idx_b = [], []
+    for block in matcher.get_matching_blocks():
+        idx_a.extend(range(block.a, block.a + block.size))
+        idx_b.extend(range(block.b, block.b + block.size))
+    return np.array(idx_a, dtype=np.intp), np.array(idx_b, dtype=np.intp)
+
+
+def visualize_diff(model_name="Qwen/Qwen2.5-0.5B", text=None, model_name_b=None, text_b=None,
+                   output_file="attention_diff.html", precision=4, memory_budget_mb=None,
+                   offline=False, dense=True, top_k=5):
+    if text is None:
+        text = "The quick brown fox jumps over the lazy dog."
+    if model_name_b is None:
+        model_name_b = model_name
+    if text_b is None:
+        text_b = text
+    if model_name_b == model_name and text_b == text:
+        print("Warning: both sides of the diff are identical")
+
+    tokenizer_a, model_a, model_name = load_session(model_name)
+    tokenizer_b, model_b, model_name_b = load_session(model_name_b)
+
+    shape_a = (model_a.config.num_hidden_layers, model_a.config.num_attention_heads)
+    shape_b = (model_b.config.num_hidden_layers, model_b.config.num_attention_heads)
+    if shape_a != shape_b:
+        raise ValueError(
+            f"Cannot diff {model_name} {shape_a} against {model_name_b} {shape_b}: "
+            "layer/head counts differ"
+        )
+
+    # A, B and their aligned difference each get a third of the budget
+    memory_budget = get_memory_budget(memory_budget_mb)
+    if memory_budget is not None:
+        memory_budget //= 3
+
+    print(f"Processing text A: '{text}'")
+    input_ids_a, tokens_a = tokenize(tokenizer_a, text)
+    attention_a, layers_a = extract_attention(model_a, input_ids_a, memory_budget, dense=dense, top_k=top_k)
+
+    print(f"Processing text B: '{text_b}'")
+    input_ids_b, tokens_b = tokenize(tokenizer_b, text_b)
+    attention_b, layers = extract_attention(model_b, input_ids_b, memory_budget, layers_a, dense, top_k)
+    rows_a = [layers_a.index(layer) for layer in layers]
+
+    idx_a, idx_b = align_tokens(tokens_a, tokens_b)
+    if len(idx_a) == 0:
+        raise ValueError("No aligned tokens between the two inputs")
+    print(f"Aligned {len(idx_a)} of {len(tokens_a)}/{len(tokens_b)} tokens")
+
+    # Entropy of the aligned query rows only, so unmatched tokens on either side do not shift the delta
+    entropy_delta = head_entropy(attention_b, idx_b) - head_entropy(attention_a, idx_a)[rows_a]
+
+    # Only the aligned sub-matrices are kept; B - A is vectorized over heads and query rows,
+    # one layer at a time, and spilled like the inputs were
+    num_layers, num_heads = len(layers), attention_b.shape[1]
+    spill = isinstance(attention_a, np.memmap) or isinstance(attention_b, np.memmap)
+    diff = allocate_attention((num_layers, num_heads, len(idx_a), len(idx_a)), spill)
+    for i, row_a in enumerate(rows_a):
+        diff[i] = np.asarray(attention_b[i])[:, idx_b[:, None], idx_b]
+        diff[i] -= np.asarray(attention_a[row_a])[:, idx_a[:, None], idx_a]
+    del attention_a, attention_b
+
+    viz_data = {
+        "mode": "diff",
+        "tokens": [tokens_a[i] for i in idx_a],
+        "entropy": _rounded(entropy_delta, precision),
+        "summary": summarize_attention(diff, top_k, by_magnitude=True, precision=precision),
+        "layers": layers,
+        "num_layers": num_layers,
+        "num_heads": num_heads,
+        "model_name": model_name if model_name == model_name_b else f"{model_name_b} − {model_name}"
+    }
+
+    print("Generating diff visualization...")
+    output_path = write_html(viz_data, output_file, offline, diff if dense else None, precision)
+    print(f"Diff visualization saved to {output_path}")
+    return output_path
+
+
+CHART_JS_CDN = '<script src="https://cdn.jsdelivr.net/npm/chart.js"></script>'
+
+# Stand-in for the subset of Chart.js the page uses (bar charts, optionally horizontal),
+# embedded by offline pages. update() only repaints the bars whose value or color changed.
+OFFLINE_CHART_JS = '''<script>
+class Chart {
+    constructor(canvas, config) {
+        this.canvas = canvas;
+        this.ctx = canvas.getContext('2d');
+        this.data = config.data;
+        this.options = config.options || {};
+        this.horizontal = this.options.indexAxis === 'y';
+        this.drawn = null;
+        canvas.style.display = 'block';
+        canvas.style.width = '100%';
+        canvas.style.height = '100%';
+        window.addEventListener('resize', () => { this.drawn = null; this.update(); });
+        this.update();
+    }
+
+    axes() {
+        const scales = this.options.scales || {};
+        return {
+            value: scales[this.horizontal ? 'x' : 'y'] || {},
+            category: scales[this.horizontal ? 'y' : 'x'] || {}
+        };
+    }
+
+    update() {
+        const ds = this.data.datasets[0];
+        const labels = this.data.labels.map(String);
+        const values = ds.data.map(Number);
+        const n = Math.max(values.length, labels.length);
+        const bg = ds.backgroundColor || '#999';
+        const colors = Array.from({length: n}, (_, i) => Array.isArray(bg) ? bg[i % bg.length] : bg);
+        const axis = this.axes().value;
+        const finite = values.filter(Number.isFinite);
+        const min = axis.min !== undefined ? axis.min : Math.min(0, ...finite);
+        let max = axis.max !== undefined ? axis.max : Math.max(0, ...finite);
+        if (max <= min) max = min + 1;
+
+        // Labels are not part of the key: changed labels are repainted with their bars, and
+        // only a label wider than the space laid out for labels needs a new layout
+        const rect = this.canvas.getBoundingClientRect();
+        const key = [rect.width, rect.height, n, min, max].join('|');
+        if (!this.drawn || this.drawn.key !== key || !this.labelsFit(labels)) {
+            this.layout(rect, labels, n, min, max);
+            this.drawn = {key, values: [], colors: [], labels: []};
+        }
+        for (let i = 0; i < n; i++) {
+            if (!Object.is(this.drawn.values[i], values[i]) || this.drawn.colors[i] !== colors[i] ||
+                this.drawn.labels[i] !== labels[i]) {
+                this.drawBar(i, values[i], colors[i], labels[i]);
+            }
+        }
+        this.drawn.values = values;
+        this.drawn.colors = colors;
+        this.drawn.labels = labels;
+    }
+
+    labelsFit(labels) {
+        const p = this.plot;
+        if (!p.labelFont) return true;
+        this.ctx.font = p.labelFont;
+        return labels.every((l, i) => l === this.drawn.labels[i] || this.ctx.measureText(l).width <= p.labelWidth);
+    }
+
+    layout(rect, labels, n, min, max) {
+        const ctx = this.ctx;
+        const dpr = window.devicePixelRatio || 1;
+        this.canvas.width = Math.round(rect.width * dpr);
+        this.canvas.height = Math.round(rect.height * dpr);
+        ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+        ctx.clearRect(0, 0, rect.width, rect.height);
+
+        const {value, category} = this.axes();
+        const valueTicks = value.ticks || {};
+        const categoryTicks = category.ticks || {};
+        const valueFont = (valueTicks.font || {}).size || 9;
+        const categoryFont = (categoryTicks.font || {}).size || 9;
+        const format = valueTicks.callback || (v => +v.toFixed(2));
+        const tickValues = [min, (min + max) / 2, max];
+
+        let labelWidth = 0;
+        if (category.display !== false) {
+            ctx.font = `${categoryFont}px sans-serif`;
+            labelWidth = Math.max(0, ...labels.map(l => ctx.measureText(l).width));
+        }
+        let left = 0, top = 0, right = rect.width, bottom = rect.height;
+        if (this.horizontal) {
+            if (category.display !== false) left = labelWidth + 6;
+        } else {
+            if (category.display !== false) bottom -= categoryFont + 4;
+            if (value.display !== false) {
+                ctx.font = `${valueFont}px sans-serif`;
+                left = Math.max(...tickValues.map(v => ctx.measureText(format(v)).width)) + 6;
+                top = valueFont / 2 + 1;
+            }
+        }
+        const span = this.horizontal ? right - left : bottom - top;
+        const toPixel = v => {
+            const t = (Math.min(Math.max(v, min), max) - min) / (max - min);
+            return this.horizontal ? left + t * span : bottom - t * span;
+        };
+        const showGrid = value.display !== false && (value.grid || {}).display !== false;
+        const slot = (this.horizontal ? bottom - top : right - left) / Math.max(n, 1);
+        this.plot = {
+            left, top, right, bottom, n, toPixel, slot,
+            grid: showGrid ? tickValues.map(v => Math.round(toPixel(v)) + 0.5) : [],
+            gridColor: (value.grid || {}).color || '#eee',
+            labelFont: category.display !== false ? `${categoryFont}px sans-serif` : null,
+            labelColor: categoryTicks.color || '#666',
+            labelBottom: rect.height,
+            labelWidth,
+            // Below the bars, only every step-th label is drawn so neighbours do not overlap
+            labelStep: this.horizontal ? 1 : Math.max(1, Math.ceil((labelWidth + 4) / slot))
+        };
+
+        if (value.display !== false && !this.horizontal) {
+            ctx.font = `${valueFont}px sans-serif`;
+            ctx.fillStyle = valueTicks.color || '#999';
+            ctx.textAlign = 'right';
+            ctx.textBaseline = 'middle';
+            tickValues.forEach(v => ctx.fillText(format(v), left - 4, toPixel(v)));
+        }
+    }
+
+    drawBar(i, v, color, label) {
+        const ctx = this.ctx;
+        const p = this.plot;
+        const start = (this.horizontal ? p.top : p.left) + i * p.slot;
+        const pad = p.slot * 0.14;
+
+        ctx.strokeStyle = p.gridColor;
+        ctx.lineWidth = 1;
+        if (this.horizontal) {
+            ctx.clearRect(p.left, start, p.right - p.left, p.slot);
+            p.grid.forEach(x => { ctx.beginPath(); ctx.moveTo(x, start); ctx.lineTo(x, start + p.slot); ctx.stroke(); });
+        } else {
+            ctx.clearRect(start, p.top, p.slot, p.bottom - p.top);
+            p.grid.forEach(y => { ctx.beginPath(); ctx.moveTo(start, y); ctx.lineTo(start + p.slot, y); ctx.stroke(); });
+        }
+        if (p.labelFont && i % p.labelStep === 0 && label !== this.drawn.labels[i]) this.drawLabel(start, label);
+        if (!Number.isFinite(v)) return;
+
+        const base = p.toPixel(0), end = p.toPixel(v);
+        ctx.fillStyle = color;
+        if (this.horizontal) {
+            ctx.fillRect(Math.min(base, end), start + pad, Math.abs(end - base), p.slot - 2 * pad);
+        } else {
+            ctx.fillRect(start + pad, Math.min(base, end), p.slot - 2 * pad, Math.abs(end - base));
+        }
+    }
+
+    drawLabel(start, label) {
+        const ctx = this.ctx;
+        const p = this.plot;
+        const center = start + p.slot / 2;
+        ctx.font = p.labelFont;
+        ctx.fillStyle = p.labelColor;
+        if (this.horizontal) {
+            ctx.clearRect(0, start, p.left, p.slot);
+            if (label === undefined) return;
+            ctx.textAlign = 'right';
+            ctx.textBaseline = 'middle';
+            ctx.fillText(label, p.left - 4, center);
+        } else {
+            // A drawn label owns the width of labelStep slots around its own
+            const from = Math.max(p.left, center - p.labelStep * p.slot / 2);
+            const to = Math.min(p.right, center + p.labelStep * p.slot / 2);
+            ctx.clearRect(from, p.bottom, to - from, p.labelBottom - p.bottom);
+            if (label === undefined) return;
+            ctx.textAlign = 'center';
+            ctx.textBaseline = 'top';
+            ctx.fillText(label, center, p.bottom + 3);
+        }
+    }
+}
+</script>'''
+
+
+DATA_PLACEHOLDER = "__ATTENTION_DATA__"
+
+
+def generate_html(data, offline=False):
+    head, tail = _page_template(offline).split(DATA_PLACEHOLDER)
+    return head + json.dumps(data) + tail
+
+
+def write_html(data, output_file, offline=False, attention=None, precision=None):
+    head, tail = _page_template(offline).split(DATA_PLACEHOLDER)
+
+    # Written under a unique temporary name next to the output, so readers never see a partial
+    # page and concurrent writers of the same path do not share a temporary file
+    fd, tmp_file = tempfile.mkstemp(prefix=f"{os.path.basename(output_file)}.", suffix=".tmp",
+                                    dir=os.path.dirname(output_file) or ".")
+    try:
+        with open(fd, "w", encoding="utf-8") as f:
+            f.write(head)
+            f.write("{")
+            _write_json_items(f, data)
+            if attention is not None:
+                f.write(',"attention":')
+                _write_json_rows(f, attention, precision)
+            f.write("}")
+            f.write(tail)
+        # mkstemp creates the file readable by its owner only
+        os.chmod(tmp_file, 0o644)
+        os.replace(tmp_file, output_file)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+    return os.path.abspath(output_file)
+
+
+def _write_json_rows(f, values, precision=None):
+    # Row by row, so only one row's list and JSON text are alive at a time
+    if values.ndim > 1:
+        f.write("[")
+        for i in range(len(values)):
+            f.write("," if i else "")
+            _write_json_rows(f, values[i], precision)
+        f.write("]")
+    else:
+        f.write(json.dumps(np.asarray(values).tolist() if precision is None else _rounded(values, precision)))
+
+
+def _write_json_items(f, data):
+    # Item by item, so only one item's JSON text is alive at a time
+    for i, (key, value) in enumerate(data.items()):
+        f.write(("," if i else "") + json.dumps(key) + ":")
+        if isinstance(value, dict):
+            f.write("{")
+            _write_json_items(f, value)
+            f.write("}")
+        else:
+            f.write(json.dumps(value))
+
+
+def _page_template(offline=False):
+    data_json = DATA_PLACEHOLDER
+    chart_script = OFFLINE_CHART_JS if offline else CHART_JS_CDN
     
     return f'''<!DOCTYPE html>
 <html lang="en">
@@ -85,7 +672,7 @@ def generate_html(data):
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Attention Visualization</title>
-    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
+    {chart_script}
     <style>
         * {{ margin: 0; padding: 0; box-sizing: border-box; }}
         body {{
@@ -361,6 +948,21 @@ def generate_html(data):
             border-radius: 3px;
             padding: 12px;
         }}
+        .summary-grid {{
+            display: flex;
+            gap: 24px;
+            margin-top: 12px;
+        }}
+        .summary-col {{
+            flex: 1;
+            font-size: 11px;
+        }}
+        .summary-title {{
+            font-size: 11px;
+            font-weight: 500;
+            color: #666;
+            margin-bottom: 8px;
+        }}
         .tooltip {{
             position: fixed;
             background: #fff;
@@ -540,6 +1142,16 @@ def generate_html(data):
                 <div class="dist-chart">
                     <canvas id="dist-chart"></canvas>
                 </div>
+                <div class="summary-grid">
+                    <div class="summary-col">
+                        <div class="summary-title" id="token-stats"></div>
+                        <div id="token-sources"></div>
+                    </div>
+                    <div class="summary-col">
+                        <div class="summary-title">Most attended tokens (layer, all heads)</div>
+                        <div id="top-received"></div>
+                    </div>
+                </div>
             </div>
         </main>
     </div>
@@ -557,6 +1169,10 @@ def generate_html(data):
     
     <script>
         const DATA = {data_json};
+        const DIFF = DATA.mode === 'diff';
+        const layerLabel = i => DATA.layers ? DATA.layers[i] : i;
+        const SUMMARY = DATA.summary;
+        const tokenLabel = i => DATA.tokens[i].trim() || '␣';
         
         let state = {{
             layer: 0,
@@ -573,11 +1189,12 @@ def generate_html(data):
         document.addEventListener('DOMContentLoaded', init);
         
         function init() {{
+            if (DIFF) document.querySelector('.header h1').textContent = 'Attention Difference (B − A)';
             document.getElementById('model-name').textContent = DATA.model_name;
             document.getElementById('total-layers').textContent = DATA.num_layers;
             document.getElementById('total-heads').textContent = DATA.num_heads;
             document.getElementById('token-count').textContent = DATA.tokens.length;
-            document.getElementById('layer-max').textContent = DATA.num_layers - 1;
+            document.getElementById('layer-max').textContent = layerLabel(DATA.num_layers - 1);
             
             const slider = document.getElementById('layer-slider');
             slider.max = DATA.num_layers - 1;
@@ -620,7 +1237,22 @@ def generate_html(data):
             return colors;
         }}
         
+        function getDiffColor(v) {{
+            const mag = Math.min(Math.abs(v), 1);
+            const hue = v >= 0 ? 0 : 220;
+            return `hsl(${{hue}}, ${{40 + mag * 50}}%, ${{96 - mag * 50}}%)`;
+        }}
+        
+        function getCellColor(v) {{
+            if (DIFF) return getDiffColor(v * 4);
+            const hue = 250 - v * 30;
+            const sat = 50 + v * 40;
+            const light = 95 - v * 50;
+            return `hsl(${{hue}}, ${{sat}}%, ${{light}}%)`;
+        }}
+        
         function getDistColors(values) {{
+            if (DIFF) return values.map(v => getDiffColor(v * 4));
             return values.map(v => {{
                 const hue = 220 + v * 60;
                 const sat = 60 + v * 20;
@@ -659,7 +1291,7 @@ def generate_html(data):
                     plugins: {{ legend: {{ display: false }} }},
                     scales: {{
                         x: {{ grid: {{ display: false }}, ticks: {{ font: {{ size: 9 }}, color: '#666' }} }},
-                        y: {{ grid: {{ color: '#eee' }}, ticks: {{ font: {{ size: 9 }}, color: '#999', callback: v => Math.round(v*100)+'%' }}, max: 1 }}
+                        y: {{ grid: {{ color: '#eee' }}, ticks: {{ font: {{ size: 9 }}, color: '#999', callback: v => Math.round(v*100)+'%' }}, max: 1, min: DIFF ? -1 : 0 }}
                     }}
                 }}
             }});
@@ -670,15 +1302,15 @@ def generate_html(data):
                 options: {{
                     indexAxis: 'y', responsive: true, maintainAspectRatio: false,
                     plugins: {{ legend: {{ display: false }} }},
-                    scales: {{ x: {{ display: false, max: 1 }}, y: {{ grid: {{ display: false }}, ticks: {{ font: {{ size: 8 }}, color: '#666' }} }} }}
+                    scales: {{ x: {{ display: false, max: 1, min: DIFF ? -1 : 0 }}, y: {{ grid: {{ display: false }}, ticks: {{ font: {{ size: 8 }}, color: '#666' }} }} }}
                 }}
             }});
         }}
         
         function update() {{
-            document.getElementById('current-layer').textContent = state.layer;
+            document.getElementById('current-layer').textContent = layerLabel(state.layer);
             document.getElementById('layer-slider').value = state.layer;
-            document.getElementById('matrix-info').textContent = `Layer ${{state.layer}}`;
+            document.getElementById('matrix-info').textContent = `Layer ${{layerLabel(state.layer)}}`;
             
             entropyChart.data.datasets[0].data = DATA.entropy[state.layer];
             entropyChart.update('none');
@@ -698,9 +1330,36 @@ def generate_html(data):
             updateDist();
         }}
         
+        // Dense row when the matrix is embedded, otherwise rebuilt from the top-k summary
+        function getRow(layer, head, r) {{
+            if (DATA.attention) return DATA.attention[layer][head][r];
+            const row = new Array(DATA.tokens.length).fill(0);
+            SUMMARY.target_index[layer][head][r].forEach((c, k) => {{
+                if (c >= 0) row[c] = SUMMARY.target_value[layer][head][r][k];
+            }});
+            return row;
+        }}
+        
+        function topItems(indexes, values, k) {{
+            return indexes.map((i, j) => ({{i, val: values[j]}})).filter(x => x.i >= 0).slice(0, k);
+        }}
+        
+        function rankRows(items, scale = 1, format = v => (v * 100).toFixed(1) + '%') {{
+            return items.map((x, i) => {{
+                const hue = 240 + i * 20;
+                const width = Math.min(Math.abs(x.val) / scale, 1) * 100;
+                return `
+                <div class="tooltip-row">
+                    <span class="tooltip-rank" style="background:hsl(${{hue}}, 60%, 92%); color:hsl(${{hue}}, 60%, 40%);">${{i+1}}</span>
+                    <span class="tooltip-token">${{tokenLabel(x.i)}}</span>
+                    <span class="tooltip-bar"><span class="tooltip-bar-fill" style="width:${{width}}%; background:hsl(${{hue}}, 65%, 55%);"></span></span>
+                    <span class="tooltip-pct">${{format(x.val)}}</span>
+                </div>
+            `}}).join('');
+        }}
+        
         function renderMatrix(id, head) {{
             const container = document.getElementById(id);
-            const attn = DATA.attention[state.layer][head];
             const n = DATA.tokens.length;
             
             let html = '<div class="matrix-header">';
@@ -710,15 +1369,12 @@ def generate_html(data):
             html += '</div>';
             
             for (let r = 0; r < n; r++) {{
+                const row = getRow(state.layer, head, r);
                 html += '<div class="matrix-row">';
                 html += `<div class="matrix-row-label" title="${{DATA.tokens[r]}}">${{DATA.tokens[r].trim() || '␣'}}</div>`;
                 for (let c = 0; c < n; c++) {{
                     if (c <= r) {{
-                        const v = attn[r][c];
-                        const hue = 250 - v * 30;
-                        const sat = 50 + v * 40;
-                        const light = 95 - v * 50;
-                        const color = `hsl(${{hue}}, ${{sat}}%, ${{light}}%)`;
+                        const color = getCellColor(row[c]);
                         html += `<div class="matrix-cell" style="background:${{color}}" 
                             onmouseenter="showTip(event,${{r}},${{c}},${{head}})" onmouseleave="hideTip()"></div>`;
                     }} else {{
@@ -731,10 +1387,28 @@ def generate_html(data):
         }}
         
         function updateDist() {{
-            const row = DATA.attention[state.layer][state.head][state.token];
+            const row = getRow(state.layer, state.head, state.token);
             distChart.data.datasets[0].data = row;
             distChart.data.datasets[0].backgroundColor = getDistColors(row);
             distChart.update('none');
+            updateSummary();
+        }}
+        
+        function updateSummary() {{
+            const {{layer, head, token}} = state;
+            const gives = SUMMARY.outgoing[layer][head][token];
+            const receives = SUMMARY.incoming[layer][head][token];
+            document.getElementById('token-stats').textContent =
+                `"${{tokenLabel(token)}}" gives ${{gives.toFixed(2)}} · receives ${{receives.toFixed(2)}} — most attended by`;
+            const sources = topItems(SUMMARY.source_index[layer][head][token], SUMMARY.source_value[layer][head][token], 5);
+            document.getElementById('token-sources').innerHTML = rankRows(sources);
+            
+            const heads = SUMMARY.incoming[layer];
+            const mean = DATA.tokens.map((_, i) => heads.reduce((sum, h) => sum + h[i], 0) / heads.length);
+            const ranked = mean.map((val, i) => ({{val, i}}))
+                .sort((a, b) => DIFF ? Math.abs(b.val) - Math.abs(a.val) : b.val - a.val).slice(0, 5);
+            const scale = Math.max(...ranked.map(x => Math.abs(x.val)), 1e-9);
+            document.getElementById('top-received').innerHTML = rankRows(ranked, scale, v => v.toFixed(2));
         }}
         
         function selectHead(h) {{
@@ -782,27 +1456,19 @@ def generate_html(data):
         
         function showTip(e, r, c, h) {{
             const tip = document.getElementById('tooltip');
-            const attn = DATA.attention[state.layer][h];
-            const v = attn[r][c];
+            const v = getRow(state.layer, h, r)[c];
             
             document.getElementById('tooltip-pair').textContent = `"${{DATA.tokens[r].trim()||'␣'}}" → "${{DATA.tokens[c].trim()||'␣'}}"`;
-            document.getElementById('tooltip-value').textContent = (v * 100).toFixed(1) + '%';
+            // Without the dense matrix only the top-k cells of a row are known
+            const known = DATA.attention || SUMMARY.target_index[state.layer][h][r].includes(c);
+            document.getElementById('tooltip-value').textContent = known ? (v * 100).toFixed(1) + '%' : '—';
             
-            const row = attn[r].slice(0, r + 1).map((val, i) => ({{val, i}})).sort((a, b) => b.val - a.val).slice(0, 3);
-            tooltipChart.data.labels = row.map(x => DATA.tokens[x.i].trim() || '␣');
+            const row = topItems(SUMMARY.target_index[state.layer][h][r], SUMMARY.target_value[state.layer][h][r], 3);
+            tooltipChart.data.labels = row.map(x => tokenLabel(x.i));
             tooltipChart.data.datasets[0].data = row.map(x => x.val);
             tooltipChart.update('none');
             
-            document.getElementById('tooltip-list').innerHTML = row.map((x, i) => {{
-                const hue = 240 + i * 20;
-                return `
-                <div class="tooltip-row">
-                    <span class="tooltip-rank" style="background:hsl(${{hue}}, 60%, 92%); color:hsl(${{hue}}, 60%, 40%);">${{i+1}}</span>
-                    <span class="tooltip-token">${{DATA.tokens[x.i].trim()||'␣'}}</span>
-                    <span class="tooltip-bar"><span class="tooltip-bar-fill" style="width:${{x.val*100}}%; background:hsl(${{hue}}, 65%, 55%);"></span></span>
-                    <span class="tooltip-pct">${{(x.val*100).toFixed(1)}}%</span>
-                </div>
-            `}}).join('');
+            document.getElementById('tooltip-list').innerHTML = rankRows(row);
             
             const rect = e.target.getBoundingClientRect();
             let left = rect.right + 8, top = rect.top;